@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""Fused document pipeline: preprocess -> GPU -> postprocess in one process.
+
+The per-stage Batch containers hand every byte through EFS, so each stage
+pays the network twice per document. Running the three stages as asyncio
+tasks connected by bounded queues keeps documents in memory end to end:
+only the S3 download and upload cross the network, the GPU consumes
+batches directly from the preprocessor, and EFS drops out of the data
+path entirely.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import boto3
+import torch
+from botocore.config import Config
+from pythonjsonlogger import jsonlogger
+
+# Configure logging
+logger = logging.getLogger()
+logHandler = logging.StreamHandler()
+formatter = jsonlogger.JsonFormatter()
+logHandler.setFormatter(formatter)
+logger.addHandler(logHandler)
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+# Bounded hand-off between stages; deep enough to keep every stage busy,
+# shallow enough to bound memory when one stage falls behind
+QUEUE_DEPTH = 16
+
+# Files per forward pass, matching the standalone GPU stage
+BATCH_SIZE = 32
+
+# Padded row length of a batch
+MAX_FILE_BYTES = 1 << 20
+
+# End-of-stream sentinel passed down the queues
+_END = object()
+
+def setup_aws_clients():
+    """Initialize AWS clients with proper error handling."""
+    try:
+        # Pool sized past the download/upload fan-out, adaptive retries for
+        # S3 throttling
+        s3 = boto3.client('s3', config=Config(
+            max_pool_connections=64,
+            retries={'mode': 'adaptive', 'max_attempts': 5},
+            tcp_keepalive=True,
+            s3={'addressing_style': 'virtual'}
+        ))
+        return s3
+    except Exception as e:
+        logger.error(f"Failed to initialize AWS clients: {str(e)}")
+        sys.exit(1)
+
+def setup_gpu():
+    """Setup and verify GPU availability."""
+    try:
+        if not torch.cuda.is_available():
+            logger.error("No GPU available")
+            return False, None
+
+        # Set device to GPU
+        torch.cuda.set_device(0)
+        device_name = torch.cuda.get_device_name(0)
+        logger.info(f"Using GPU: {device_name}")
+        return True, device_name
+    except Exception as e:
+        logger.error(f"Error setting up GPU: {str(e)}")
+        return False, None
+
+def load_model():
+    """Load the ML model, move it to the GPU, and compile its forward."""
+    try:
+        logger.info("Loading model...")
+        if os.environ.get('SIMULATE_GPU'):
+            time.sleep(1)  # Simulate model loading time
+
+        # Placeholder byte-identity model until the real document model is
+        # wired in; a real nn.Module drops in here unchanged
+        model = torch.nn.Identity().to('cuda', dtype=torch.bfloat16).eval()
+        model = torch.compile(model, mode='reduce-overhead', fullgraph=True)
+
+        # Warm up on the fixed batch shape so triton autotuning settles
+        warmup = torch.zeros((BATCH_SIZE, MAX_FILE_BYTES), dtype=torch.uint8, device='cuda')
+        for _ in range(3):
+            with torch.autocast('cuda', dtype=torch.bfloat16):
+                model(warmup)
+        torch.cuda.synchronize()
+
+        logger.info("Model loaded successfully")
+        return model
+    except Exception as e:
+        logger.error(f"Error loading model: {str(e)}")
+        return None
+
+async def preprocess_stage(s3, bucket, directory, gpu_queue):
+    """Download documents from S3, stamp them, and feed the GPU stage."""
+    loop = asyncio.get_running_loop()
+    marker = f"[Preprocessed at {time.strftime('%Y-%m-%d %H:%M:%S')}]\n".encode()
+
+    def _list_keys():
+        keys = []
+        paginator = s3.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=directory):
+            keys.extend(obj['Key'] for obj in page.get('Contents', [])
+                        if not obj['Key'].endswith('/'))
+        return keys
+
+    keys = await loop.run_in_executor(None, _list_keys)
+    logger.info(f"Preprocessing {len(keys)} files from s3://{bucket}/{directory}")
+
+    async def _fetch(key):
+        body = await loop.run_in_executor(
+            None, lambda: s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+        )
+        await gpu_queue.put((os.path.basename(key), marker + body))
+
+    await asyncio.gather(*[_fetch(key) for key in keys])
+    await gpu_queue.put(_END)
+    return len(keys)
+
+async def gpu_stage(model, device_name, gpu_queue, upload_queue):
+    """Batch documents from the preprocess stage through the model."""
+    loop = asyncio.get_running_loop()
+    marker = f"\n[GPU Processed with {device_name} at {time.strftime('%Y-%m-%d %H:%M:%S')}]".encode()
+
+    # One pinned staging buffer per direction so both copies are async DMA
+    pinned_in = torch.empty((BATCH_SIZE, MAX_FILE_BYTES), dtype=torch.uint8, pin_memory=True)
+    pinned_out = torch.empty((BATCH_SIZE, MAX_FILE_BYTES), dtype=torch.uint8, pin_memory=True)
+    static_input = torch.empty((BATCH_SIZE, MAX_FILE_BYTES), dtype=torch.uint8, device='cuda')
+
+    def _infer_batch(batch):
+        """Run one padded batch through the model; blocking, so called
+        from a worker thread to keep the event loop free."""
+        if os.environ.get('SIMULATE_GPU'):
+            time.sleep(2)  # Simulate processing time
+        lengths = []
+        for row, (_, data) in enumerate(batch):
+            pinned_in[row, :len(data)].copy_(
+                torch.frombuffer(bytearray(data), dtype=torch.uint8)
+            )
+            lengths.append(len(data))
+        static_input.copy_(pinned_in, non_blocking=True)
+        with torch.autocast('cuda', dtype=torch.bfloat16):
+            gpu_result = model(static_input)
+        pinned_out.copy_(gpu_result, non_blocking=True)
+        torch.cuda.synchronize()
+        return [bytes(pinned_out[row, :length].numpy())
+                for row, length in enumerate(lengths)]
+
+    async def _flush(batch):
+        results = await loop.run_in_executor(None, _infer_batch, batch)
+        for (name, _), result in zip(batch, results):
+            await upload_queue.put((name, result + marker))
+
+    batch = []
+    while True:
+        item = await gpu_queue.get()
+        if item is _END:
+            break
+        name, data = item
+        if len(data) > MAX_FILE_BYTES:
+            # Oversized documents bypass the padded batch and run eagerly
+            def _eager():
+                gpu_data = torch.frombuffer(bytearray(data), dtype=torch.uint8).to('cuda')
+                with torch.autocast('cuda', dtype=torch.bfloat16):
+                    return bytes(model(gpu_data).cpu().numpy())
+            result = await loop.run_in_executor(None, _eager)
+            await upload_queue.put((name, result + marker))
+            continue
+        batch.append(item)
+        if len(batch) == BATCH_SIZE:
+            await _flush(batch)
+            batch = []
+
+    if batch:
+        await _flush(batch)
+    await upload_queue.put(_END)
+
+async def postprocess_stage(s3, bucket, output_prefix, upload_queue):
+    """Stamp finished documents and upload them straight to S3."""
+    loop = asyncio.get_running_loop()
+    marker = f"\n[Postprocessed at {time.strftime('%Y-%m-%d %H:%M:%S')}]".encode()
+
+    uploads = []
+    while True:
+        item = await upload_queue.get()
+        if item is _END:
+            break
+        name, data = item
+        body = data + marker
+        uploads.append(loop.run_in_executor(
+            None,
+            lambda n=name, b=body: s3.put_object(
+                Bucket=bucket, Key=f"{output_prefix}/{n}", Body=b
+            )
+        ))
+
+    await asyncio.gather(*uploads)
+    logger.info(f"Uploaded {len(uploads)} files to s3://{bucket}/{output_prefix}")
+    return len(uploads)
+
+async def run_pipeline(s3, model, device_name, source_bucket, input_dir,
+                       output_bucket, output_prefix):
+    """Wire the three stages together with bounded queues and run them."""
+    gpu_queue = asyncio.Queue(maxsize=QUEUE_DEPTH)
+    upload_queue = asyncio.Queue(maxsize=QUEUE_DEPTH)
+
+    downloaded, _, uploaded = await asyncio.gather(
+        preprocess_stage(s3, source_bucket, input_dir, gpu_queue),
+        gpu_stage(model, device_name, gpu_queue, upload_queue),
+        postprocess_stage(s3, output_bucket, output_prefix, upload_queue),
+    )
+    logger.info(
+        "Pipeline complete",
+        extra={"downloaded": downloaded, "uploaded": uploaded}
+    )
+
+def main():
+    try:
+        # Get environment variables
+        source_bucket = os.environ.get('SOURCE_BUCKET')
+        input_dir = os.environ.get('INPUT_DIRECTORY')
+        output_bucket = os.environ.get('OUTPUT_BUCKET')
+        output_prefix = os.environ.get('OUTPUT_PREFIX')
+
+        if not all([source_bucket, input_dir, output_bucket, output_prefix]):
+            logger.error("Required environment variables are missing")
+            sys.exit(1)
+
+        # Setup GPU
+        gpu_ready, device_name = setup_gpu()
+        if not gpu_ready:
+            sys.exit(1)
+
+        # Load model
+        model = load_model()
+        if model is None:
+            sys.exit(1)
+
+        # Initialize AWS clients
+        s3 = setup_aws_clients()
+
+        # Run the fused pipeline
+        asyncio.run(run_pipeline(
+            s3, model, device_name,
+            source_bucket, input_dir, output_bucket, output_prefix
+        ))
+
+        logger.info("Pipeline completed successfully")
+
+    except Exception as e:
+        logger.error(f"Pipeline failed: {str(e)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()